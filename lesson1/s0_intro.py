@@ -267,13 +267,215 @@ my_person_2 = Person("Brad", "Pitt", Address("Hollywood", 1, "L.A."),
 print(my_person_2)
 
 
+# 1 (bonus)
+# Now imagine we have to keep tens of millions of persons in memory. Every
+# dict and every normal object carries a lot of overhead and every person gets
+# its own copy of "Port Royal", even though there are only a few cities.
+# Three tricks make a person much smaller:
+# - __slots__ (we'll cover them in lesson 2) removes the __dict__ of each object
+# - sys.intern makes all equal strings share one string object
+# - tuples are smaller than lists and equal hobby tuples can be shared, too
+from sys import intern
+
+_shared_hobbies = {}
+
+
+def share_hobbies(hobbies):
+    # the one tuple of interned hobbies, which all equal hobbies share
+    hobbies = tuple(intern(hobby) for hobby in hobbies)
+    return _shared_hobbies.setdefault(hobbies, hobbies)
+
+
+class CompactAddress:
+    __slots__ = ["street", "street_number", "city"]
+
+    def __init__(self, street, street_number, city):
+        self.street = intern(street)
+        self.street_number = street_number
+        self.city = intern(city)
+
+    def __repr__(self):
+        return f"CompactAddress({self.street!r}, {self.street_number}, {self.city!r})"
+
+
+class CompactPerson:
+    __slots__ = ["name", "fullname", "address", "hobbies"]
+
+    def __init__(self, name, fullname, address, hobbies):
+        self.name = intern(name)
+        self.fullname = intern(fullname)
+        self.address = address
+        self.hobbies = share_hobbies(hobbies)
+
+    def __repr__(self):
+        return f"CompactPerson(name={self.name}, adress={self.address},hobbies={self.hobbies})"
+
+
+def person_from_dict(person):
+    # builds a CompactPerson from the dict form of 1a
+    address = person["address"]
+    return CompactPerson(person["name"], person["fullname"],
+                         CompactAddress(address["street"],
+                                        address["street number"],
+                                        address["city"]),
+                         person["hobbies"])
+
+
+def load_people(people):
+    return [person_from_dict(person) for person in people]
+
+
+print(person_from_dict(my_person))
+
+# how much memory does each form need per person? make_people creates new
+# strings for each person, like reading them from a file would do.
+import tracemalloc
+
+
+def make_people(n):
+    cities = ["Port Royal", "Tortuga", "L.A."]
+    for i in range(n):
+        yield {"name": f"Jack{i % 1000}",
+               "fullname": "".join(["Spar", "row"]),
+               "address": {"street": "".join(["island ", "street"]),
+                           "street number": i % 100,
+                           "city": "".join(cities[i % 3])},
+               "hobbies": ["".join(["fight", "ing"]), "".join(["steal", "ing"])]}
+
+
+def person_from_dict_plain(person):
+    address = person["address"]
+    return Person(person["name"], person["fullname"],
+                  Address(address["street"], address["street number"],
+                          address["city"]),
+                  person["hobbies"])
+
+
+def bytes_per_person(build, n=100_000):
+    tracemalloc.start()
+    people = build(make_people(n))
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del people
+    return size / n
+
+print("dicts", bytes_per_person(list))
+print("classes", bytes_per_person(lambda people: [person_from_dict_plain(p) for p in people]))
+print("compact", bytes_per_person(load_people))
+
+# Finding all persons from Tortuga means looking at every single person. A
+# dict, which maps each city to the set of persons living there, finds them at
+# once, no matter how many persons we have. Such a dict is called an index.
+# People keeps an index for the city, for the name and for every hobby and
+# keeps them up to date when persons are added, changed or removed.
+# Our persons have no __eq__ and __hash__ methods, so sets compare them by
+# identity, which is exactly what we need here.
+from collections import defaultdict
+
+
+class People:
+    """a collection of persons, which can be searched by city, name and hobby"""
+    def __init__(self, people=()):
+        self._people = set()
+        self._indexes = {"city": defaultdict(set), "name": defaultdict(set),
+                         "hobby": defaultdict(set)}
+        for person in people:
+            self.add(person)
+
+    def _index_values(self, person):
+        yield "city", person.address.city
+        yield "name", person.name
+        for hobby in person.hobbies:
+            yield "hobby", hobby
+
+    def add(self, person):
+        self._people.add(person)
+        for field, value in self._index_values(person):
+            self._indexes[field][value].add(person)
+
+    def remove(self, person):
+        self._people.remove(person)
+        for field, value in self._index_values(person):
+            persons = self._indexes[field].get(value)
+            if persons is not None:
+                persons.discard(person)
+                if not persons:  # don't keep empty sets around
+                    del self._indexes[field][value]
+
+    def update(self, person, name=None, city=None, hobbies=None):
+        # change a person only through update, otherwise the indexes are wrong.
+        # New values are interned and shared like in CompactPerson. Other
+        # persons may share the address object, so we give this person a new
+        # address instead of changing the shared one
+        changes = {}
+        if name is not None:
+            changes["name"] = intern(name)
+        if city is not None:
+            address = person.address
+            changes["address"] = CompactAddress(address.street,
+                                                address.street_number, city)
+        if hobbies is not None:
+            changes["hobbies"] = share_hobbies(hobbies)
+        self.remove(person)
+        for field, value in changes.items():
+            setattr(person, field, value)
+        self.add(person)
+
+    def __len__(self):
+        return len(self._people)
+
+    def __iter__(self):
+        return iter(self._people)
+
+    def _matches(self, criteria):
+        # one set of persons per criterion, e.g. city="Tortuga"
+        for field in criteria:
+            if field not in self._indexes:
+                raise TypeError(f"People has no index for {field!r}")
+        return [self._indexes[field].get(value, set())
+                for field, value in criteria.items()]
+
+    def where(self, **criteria):
+        # persons which match all criteria (AND): where(city=..., hobby=...)
+        matches = sorted(self._matches(criteria), key=len)
+        if not matches:
+            return iter(self._people)
+        smallest, *others = matches
+        # only the fewest candidates are checked against the other sets
+        return (person for person in smallest
+                if all(person in persons for persons in others))
+
+    def where_any(self, **criteria):
+        # persons which match at least one criterion (OR)
+        matches = self._matches(criteria)
+        return (person for i, persons in enumerate(matches) for person in persons
+                if not any(person in earlier for earlier in matches[:i]))
+
+
+people = People(load_people(make_people(100_000)))
+print(len(list(people.where(city="Tortuga", name="Jack7"))))
+print(len(list(people.where_any(name="Jack7", city="L.A."))))
+jack = next(people.where(name="Jack7", city="L.A."))
+people.update(jack, city="Tortuga")
+print(jack, len(list(people.where(city="Tortuga", name="Jack7"))))
+
+from timeit import timeit
+seconds = timeit(lambda: list(people.where(city="Tortuga", name="Jack7",
+                                           hobby="stealing")), number=1000)
+print(f"one query took {seconds:.3f} ms")  # 1000 queries, so seconds == ms
+
+# where and where_any are generators, they compute the results while you
+# iterate over them. Don't add, update or remove persons, while you iterate
+# over a result. Collect the persons in a list first.
+
+
 # 2
 def fib():
     x, y = 1, 1
     numbers = []
     for _ in range(10):
-        numbers.append(y)
-        x, y = x+y, x
+        numbers.append(x)
+        x, y = y, x+y
     return numbers
 
 
@@ -283,6 +485,76 @@ def diff():
 
 
 print(fib())
+
+
+# 2 (bonus)
+# The list above stops after 10 numbers. A generator can produce as many
+# fibonacci numbers as you want, one after the other, without a list
+def fibonacci():
+    x, y = 1, 1
+    while True:
+        yield x
+        x, y = y, x+y
+
+
+from itertools import islice
+print(list(islice(fibonacci(), 10)))
+
+# but if you need only the n-th number, walking through all numbers before it
+# takes n steps. The "fast doubling" formulas jump from the k-th number
+# straight to the 2k-th one:
+# F(2k)   = F(k) * (2*F(k+1) - F(k))
+# F(2k+1) = F(k)**2 + F(k+1)**2
+# so fib(n) needs only about log2(n) steps. _fib_memo remembers the pairs
+# (F(k), F(k+1)) calculated so far for later calls. Only the newest
+# _FIB_MEMO_SIZE pairs are kept, otherwise a program, which asks for many
+# different n, would fill its memory with huge numbers.
+import operator
+
+_fib_memo = {}
+_FIB_MEMO_SIZE = 1024
+
+
+def _fib_pair(n):
+    if n == 0:
+        return 0, 1
+    pair = _fib_memo.get(n)
+    if pair is None:
+        a, b = _fib_pair(n // 2)
+        c = a * (2*b - a)
+        d = a*a + b*b
+        pair = _fib_memo[n] = (c, d) if n % 2 == 0 else (d, c + d)
+        if len(_fib_memo) > _FIB_MEMO_SIZE:
+            del _fib_memo[next(iter(_fib_memo))]  # the oldest one
+    return pair
+
+
+def fib(n):
+    # the n-th fibonacci number, fib(1) == fib(2) == 1
+    n = operator.index(n)  # fib(2.5) raises TypeError
+    if n < 0:
+        raise ValueError("fib(n) needs n >= 0")
+    return _fib_pair(n)[0]
+
+
+print([fib(n) for n in range(1, 11)])
+
+# how much faster is it?
+from timeit import timeit
+
+for n in (10**3, 10**5, 10**6):
+    _fib_memo.clear()
+    cold = timeit(lambda: fib(n), number=1)
+    warm = timeit(lambda: fib(n), number=1)
+    print(f"n={n} ({fib(n).bit_length()} bits): fast doubling {cold:.4f}s, "
+          f"from memo {warm:.6f}s")
+    if n <= 10**5:  # the generator would take minutes for 10**6
+        walk = timeit(lambda: next(islice(fibonacci(), n - 1, None)), number=1)
+        print(f"n={n}: generator {walk:.4f}s")
+
+# printing fib(10**6) would fail by the way: python refuses to convert ints
+# with more than 4300 digits to a string, unless you raise the limit with
+# sys.set_int_max_str_digits
              
 
 
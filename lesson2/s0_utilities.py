@@ -3,8 +3,9 @@
 # into the more advanced language features
 
 # iter with 2 arguments
-for user_input in iter(input, ""):
-    print("user typed in", user_input)
+if __name__ == "__main__":  # why? see parallel_groupby below
+    for user_input in iter(input, ""):
+        print("user typed in", user_input)
 # iter can take two arguments. the first one is a function which takes no
 # arguments. the 2nd argument is a sentinel value
 # For each step in the forloop the defined function will be called. The return
@@ -13,6 +14,178 @@ for user_input in iter(input, ""):
 # return value in its current iteration step. This is particularly usefull when
 # dealing with old C-style APIs
 
+# input() reads one line per call and blocks the whole thread while it waits.
+# That's fine for a user at the keyboard, but not for a program, which gets
+# thousands of lines per second through a pipe or a socket. LineSource keeps
+# the semantic of iter(input, ""): it yields lines (without the line break)
+# until it reads the sentinel line or reaches the end of the input. But it
+# reads big chunks at once and splits them into lines in memory.
+# With async for, LineSource can be used from asyncio, too. The blocking read
+# then runs in a thread of the event loop's default executor, so the event
+# loop keeps running. Because whole chunks are read, this happens rarely.
+import asyncio
+import codecs
+from functools import partial
+
+
+class LineSource:
+    """lines from a file, pipe or socket, read in bulk, up to a sentinel"""
+    def __init__(self, source, sentinel="", chunk_size=64 * 1024,
+                 encoding="utf-8"):
+        source = getattr(source, "buffer", source)  # e.g. sys.stdin
+        if hasattr(source, "recv"):  # a socket
+            self._read = partial(source.recv, chunk_size)
+        elif hasattr(source, "read1"):  # a buffered file or pipe
+            self._read = partial(source.read1, chunk_size)  # doesn't wait
+            # for a full chunk, if fewer bytes are available
+        else:
+            self._read = partial(source.read, chunk_size)
+        self._sentinel = sentinel
+        self._encoding = encoding
+
+    def _split(self, decoder, rest, chunk, final=False):
+        lines = (rest + decoder.decode(chunk, final)).split("\n")
+        rest = lines.pop()
+        if final and rest:
+            lines.append(rest)
+        return [line.removesuffix("\r") for line in lines], rest
+
+    def __iter__(self):
+        decoder = codecs.getincrementaldecoder(self._encoding)()
+        rest = ""
+        for chunk in iter(self._read, b""):  # read until the end
+            lines, rest = self._split(decoder, rest, chunk)
+            for line in lines:
+                if line == self._sentinel:
+                    return
+                yield line
+        lines, _ = self._split(decoder, rest, b"", final=True)
+        for line in lines:
+            if line == self._sentinel:
+                return
+            yield line
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        decoder = codecs.getincrementaldecoder(self._encoding)()
+        rest = ""
+        while chunk := await loop.run_in_executor(None, self._read):
+            lines, rest = self._split(decoder, rest, chunk)
+            for line in lines:
+                if line == self._sentinel:
+                    return
+                yield line
+        lines, _ = self._split(decoder, rest, b"", final=True)
+        for line in lines:
+            if line == self._sentinel:
+                return
+            yield line
+
+
+# for user_input in LineSource(sys.stdin):  works like the loop above
+import io
+for user_input in LineSource(io.BytesIO(b"hello\r\nworld\n\nnot read\n")):
+    print("user typed in", user_input)
+
+
+async def print_lines(source):
+    async for line in LineSource(source):
+        print("received", line)
+
+import socket
+receiver, sender = socket.socketpair()
+sender.sendall(b"hello\nasync world\n")
+sender.close()
+asyncio.run(print_lines(receiver))
+receiver.close()
+
+# Back to iter(callable, sentinel). Often the callable is a thin wrapper of a
+# C-style API, which returns one value per call. If you process the values one
+# by one in a python for loop, the loop itself costs more than the call.
+# iter_batches calls the producer from C via islice and hands out lists (or
+# arrays, if you pass a typecode) of up to batch_size values.
+# With prefetch > 0, a background thread already produces the next batches,
+# while you are still processing the current one. prefetch is the number of
+# batches the thread may produce in advance.
+# If you stop iterating early, while the thread waits inside func (e.g. for
+# data from a pipe), we can't interrupt it. The thread is a daemon, so we
+# don't wait for it: it finishes on its own, when func returns, or dies with
+# the program.
+import threading
+from array import array
+from itertools import islice
+from queue import Full, Queue
+
+
+def iter_batches(func, sentinel, batch_size=256, prefetch=0, typecode=None):
+    batches = _batches(func, sentinel, batch_size, typecode)
+    if prefetch:
+        batches = _prefetched(batches, prefetch)
+    return batches
+
+
+def _batches(func, sentinel, batch_size, typecode):
+    values = iter(func, sentinel)  # once the sentinel is seen, it stays empty
+    while batch := list(islice(values, batch_size)):
+        yield array(typecode, batch) if typecode else batch
+
+
+class _Failed:
+    __slots__ = ["error"]  # passes an exception from the thread to the caller
+    def __init__(self, error):
+        self.error = error
+
+_done = object()
+
+
+def _prefetched(batches, prefetch):
+    queue = Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):  # waits for free space, unless the consumer is gone
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for batch in batches:
+                if not put(batch):
+                    return
+        except BaseException as ex:
+            put(_Failed(ex))
+        else:
+            put(_done)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while (batch := queue.get()) is not _done:
+            if isinstance(batch, _Failed):
+                raise batch.error
+            yield batch
+    finally:  # also if the caller stops early
+        stop.set()
+        thread.join(0.2)  # enough for put to see stop, but not for a stuck func
+
+
+values = iter([3, 1, 4, 1, 5, 9, 2, 6, 0, 7])
+
+
+def read_value():  # an old API, which returns 0 if there is no more data
+    return next(values)
+
+for batch in iter_batches(read_value, 0, batch_size=3, prefetch=2):
+    print(batch)
+
+# the producer runs in a thread, so prefetching helps, when the producer waits
+# for i/o or releases the GIL (like most C functions, which do real work).
+# Pure python producers and consumers can't run at the same time.
+
 # looping throug dictionaries there are multiple ways to loop through a
 # dictionary.
 # The first one will iterate through the keys
@@ -72,6 +245,225 @@ for color, item in items:
     groupby[color].append(item)
 print(groupby)
 
+# groupby keeps every single item in memory. Often you don't need the items,
+# but only some numbers about each group: how many items, their sum, the
+# smallest, the biggest or the top 3. These numbers can be updated item by
+# item, so we only need memory for the groups, not for the items.
+# And if there are too many groups, we sort the groups we have so far by key,
+# write them to a temporary file (a "run") and start over. At the end
+# heapq.merge reads all sorted runs at the same time, like a zipper, and
+# the partial results of the same key are combined. If there are too many
+# runs, they are merged into one run first. The items are numbers now and the
+# keys must be sortable.
+import heapq
+import pickle
+import tempfile
+from itertools import groupby as consecutive_groups, islice
+from operator import itemgetter
+
+
+class GroupStats:
+    """count, sum, min, max and the top k items of one group"""
+    __slots__ = ["count", "sum", "min", "max", "top"]
+    def __init__(self, item, k):
+        self.count = 1
+        self.sum = self.min = self.max = item
+        self.top = [item][:k]  # a heap, the smallest of the top items first
+
+    def add(self, item, k):
+        self.count += 1
+        self.sum += item
+        if item < self.min:
+            self.min = item
+        elif item > self.max:
+            self.max = item
+        if len(self.top) < k:
+            heapq.heappush(self.top, item)
+        elif self.top and item > self.top[0]:  # k == 0 keeps no top items
+            heapq.heapreplace(self.top, item)
+
+    def merge(self, other, k):
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.top = heapq.nlargest(k, self.top + other.top)
+        heapq.heapify(self.top)
+
+    def __repr__(self):
+        return (f"GroupStats(count={self.count}, sum={self.sum}, min={self.min}, "
+                f"max={self.max}, top={sorted(self.top, reverse=True)})")
+
+
+def _spill(records):
+    # writes sorted (key, stats) records to a temporary file
+    run = tempfile.TemporaryFile()
+    records = iter(records)
+    while batch := list(islice(records, 1000)):  # pickle 1000 at once
+        pickle.dump(batch, run, pickle.HIGHEST_PROTOCOL)
+    run.seek(0)
+    return run
+
+
+def _read_run(run):
+    while True:
+        try:
+            yield from pickle.load(run)
+        except EOFError:
+            return
+
+
+def _merge_runs(runs, top_k):
+    # merges sorted runs and combines the stats of equal keys
+    merged = heapq.merge(*runs, key=itemgetter(0))
+    for key, parts in consecutive_groups(merged, key=itemgetter(0)):
+        _, stats = next(parts)
+        for _, other in parts:
+            stats.merge(other, top_k)
+        yield key, stats
+
+
+def streaming_groupby(pairs, top_k=3, max_groups=100_000, max_runs=64):
+    # yields (key, GroupStats) sorted by key. Memory is bounded by max_groups
+    groups = {}
+    runs = []
+    try:
+        for key, item in pairs:
+            stats = groups.get(key)
+            if stats is not None:
+                stats.add(item, top_k)
+                continue
+            if len(groups) >= max_groups:
+                runs.append(_spill(sorted(groups.items(), key=itemgetter(0))))
+                groups = {}
+                if len(runs) >= max_runs:  # don't open too many files
+                    merged = _spill(_merge_runs(map(_read_run, runs), top_k))
+                    for run in runs:
+                        run.close()
+                    runs = [merged]
+            groups[key] = GroupStats(item, top_k)
+        in_memory = sorted(groups.items(), key=itemgetter(0))
+        yield from _merge_runs([in_memory, *map(_read_run, runs)], top_k)
+    finally:
+        for run in runs:
+            run.close()
+
+
+sizes = [("red", 3), ("red", 5), ("green", 1), ("blue", 7), ("red", 4),
+         ("green", 2)]
+for color, stats in streaming_groupby(sizes, top_k=2, max_groups=2):
+    print(color, stats)
+
+# max_groups=2 forces the spilling here. In real life choose max_groups, so that
+# the groups fit comfortably into your memory. The input can be any iterable,
+# e.g. a generator reading a file line by line, so it never has to fit into
+# memory at all.
+
+# groupby runs on one core. To use all cores, we cut the input into chunks and
+# let worker processes group each chunk (map). Each worker splits its groups
+# into one shard per worker by the hash of the key. Then worker i merges
+# shard i of all chunks (reduce). Since every key lands in exactly one shard,
+# the parent only has to put the merged shards together.
+# Sending data to other processes means serialising it. Pickling item by item
+# would eat up the whole gain, so whole chunks and shards are sent with
+# marshal, which is very fast for the builtin types (str, int, float, tuple,
+# list, dict, ...). So keys and items must be of such types.
+# The hash of a str differs between python processes, so we can't use hash()
+# to pick the shard. The marshalled key doesn't work either: equal keys can be
+# marshalled differently (an interned "red" and "".join(["re", "d"]), or 1,
+# True and 1.0), so one key would land in two shards. _key_hash builds the
+# same number for equal keys in every process. Keys may be str, bytes, None,
+# bool, int, float and tuples of them.
+import marshal
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+
+
+def _key_hash(key):
+    if isinstance(key, str):
+        return zlib.crc32(key.encode("utf-8", "surrogatepass"))
+    if isinstance(key, bytes):
+        return zlib.crc32(key)
+    if key is None or isinstance(key, (int, float)):
+        # the hash of numbers doesn't change between processes and
+        # hash(1) == hash(True) == hash(1.0)
+        return hash(key)
+    if isinstance(key, tuple):
+        return hash(tuple(map(_key_hash, key)))
+    raise TypeError(f"parallel_groupby can't shard keys of type "
+                    f"{type(key).__name__}")
+
+
+def _group_chunk(blob, shards):
+    groups = defaultdict(list)
+    for key, item in marshal.loads(blob):
+        groups[key].append(item)
+    parts = [{} for _ in range(shards)]
+    for key, items in groups.items():
+        parts[_key_hash(key) % shards][key] = items
+    return [marshal.dumps(part) for part in parts]
+
+
+def _merge_shard(blobs):
+    merged = {}
+    for blob in blobs:
+        for key, items in marshal.loads(blob).items():
+            if key in merged:
+                merged[key].extend(items)
+            else:
+                merged[key] = items
+    return marshal.dumps(merged)
+
+
+def parallel_groupby(pairs, workers=None, chunksize=100_000):
+    workers = workers or os.cpu_count() or 1
+    pairs = iter(pairs)
+    chunks = iter(lambda: marshal.dumps(list(islice(pairs, chunksize))),
+                  marshal.dumps([]))  # iter with a sentinel, see above
+    groupby = defaultdict(list)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        sharded = list(executor.map(_group_chunk, chunks, repeat(workers)))
+        for blob in executor.map(_merge_shard, zip(*sharded)):
+            for key, items in marshal.loads(blob).items():
+                groupby[key].extend(items)  # never drop items of a key
+    return groupby
+
+# Code, which starts processes, belongs behind if __name__ == "__main__":
+# With the "spawn" start method (the default on windows and macOS) every
+# worker imports this module again to find _group_chunk and _merge_shard.
+# Without the guards, each worker would start its own pool and wait for
+# input() at the top of this file.
+if __name__ == "__main__":
+    print(parallel_groupby(items, workers=2))
+    # equal keys, which marshal differently, still end up in one group
+    reds = [("red", i) for i in range(1000)]
+    reds += [("".join(["re", "d"]), i) for i in range(1000)]
+    print({key: len(group) for key, group in
+           parallel_groupby(reds, workers=3, chunksize=1000).items()})
+    print(parallel_groupby([(1, "a"), (True, "b"), (1.0, "c")] * 5, workers=3))
+
+# how does it scale?
+from time import perf_counter
+
+if __name__ == "__main__":
+    many_items = [(f"color{i % 1000}", i) for i in range(1_000_000)]
+    start = perf_counter()
+    grouped = defaultdict(list)
+    for color, item in many_items:
+        grouped[color].append(item)
+    print(f"single process: {perf_counter() - start:.2f}s")
+    for workers in range(1, (os.cpu_count() or 1) + 1):
+        start = perf_counter()
+        parallel_groupby(many_items, workers=workers)
+        print(f"{workers} workers: {perf_counter() - start:.2f}s")
+
+# With one worker parallel_groupby is several times slower than the simple
+# loop: all data has to be serialised and sent to another process and back.
+# Every additional core shares the grouping work, so the more cores you have
+# and the bigger the input, the more it pays off. Measure before you switch.
+
 # another usefull datastructure is ChainMap
 # let's assume that we have a couple of options from different sources
 # some defaults
@@ -92,6 +484,214 @@ print(chain_map["verbose"])
 # map, then in the 3rd map and so on and if the key isn't found in none of
 # these it will raise ValueError
 
+# Every chain_map["debug"] tries the maps one after the other. With 3 maps
+# that doesn't matter, but if options are read on every request and there are
+# many layers, it adds up. Options are read much more often than they change.
+# So LayeredConfig does the lookup work when something changes: it keeps one
+# flat dict with the winning value of every key. Since LayeredConfig is a
+# dict itself, a lookup is a plain dict lookup.
+# A change of one layer only recalculates the keys of that change, and every
+# change increments version. So you can store a value derived from the config
+# together with the version and recalculate it only if the version changed.
+
+
+class LayeredConfig(dict):
+    """like ChainMap, but with precomputed lookups"""
+    def __init__(self, *layers):
+        super().__init__()
+        self.layers = [dict(layer) for layer in layers]  # first one wins
+        self.version = 0
+        self._refresh(set().union(*self.layers))
+
+    def _refresh(self, keys):
+        for key in keys:
+            for layer in self.layers:
+                if key in layer:
+                    super().__setitem__(key, layer[key])
+                    break
+            else:
+                super().pop(key, None)
+        self.version += 1
+
+    def set(self, index, key, value):
+        self.layers[index][key] = value
+        self._refresh((key,))
+
+    def delete(self, index, key):
+        del self.layers[index][key]
+        self._refresh((key,))
+
+    def replace_layer(self, index, layer):
+        old, self.layers[index] = self.layers[index], dict(layer)
+        self._refresh(old.keys() | self.layers[index].keys())
+
+    def __setitem__(self, key, value):  # like ChainMap, write to the first layer
+        self.set(0, key, value)
+
+    def __delitem__(self, key):
+        self.delete(0, key)
+
+    # the other dict methods, which change the dict, would change only the
+    # flat view. Like in ChainMap, they change the first layer instead
+    def update(self, *args, **kwargs):
+        changes = dict(*args, **kwargs)
+        self.layers[0].update(changes)
+        self._refresh(changes)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self.set(0, key, default)
+        return self[key]
+
+    def pop(self, key, *default):
+        try:
+            value = self.layers[0].pop(key)
+        except KeyError:
+            if default:
+                return default[0]
+            raise KeyError(f"Key not found in the first layer: {key!r}")
+        self._refresh((key,))
+        return value
+
+    def popitem(self):
+        try:
+            key, value = self.layers[0].popitem()
+        except KeyError:
+            raise KeyError("No keys found in the first layer.")
+        self._refresh((key,))
+        return key, value
+
+    def clear(self):
+        old, self.layers[0] = self.layers[0], {}
+        self._refresh(old)
+
+    def __repr__(self):
+        return f"LayeredConfig({', '.join(map(repr, self.layers))})"
+
+
+config = LayeredConfig(cmd_options, env_options, default_options)
+print(config["debug"], config["background"], config["verbose"], config.version)
+config.set(1, "background", "blue")
+config.delete(0, "debug")
+print(config["debug"], config["background"], config.version)
+
+# The flat dict is a copy. If you change cmd_options directly, config won't
+# notice. Always change the layers through set, delete and replace_layer or
+# the dict methods, which write to the first layer like ChainMap does.
+
+from timeit import timeit
+
+for depth in (3, 10, 50):
+    layers = [{f"option{i}": i} for i in range(depth - 1)] + [{"debug": True}]
+    chained, layered = ChainMap(*layers), LayeredConfig(*layers)
+    for name, options in (("ChainMap", chained), ("LayeredConfig", layered)):
+        seconds = timeit(lambda: options["debug"], number=100_000) / 100_000
+        print(f"depth {depth:2} {name:13} {seconds * 1e9:6.0f} ns per lookup")
+
+# In a program, which runs for weeks, we want to pick up changed option files
+# without a restart. ReloadingConfig reads each layer from a json file. A
+# background thread checks every interval seconds, if the modification time of
+# a file changed (the standard library has no portable way to get notified by
+# the operating system, so we poll). If so, it parses the files and builds a
+# new LayeredConfig. Then it swaps the new one in with a single assignment.
+# Readers never wait for a lock: they always see either the old or the new
+# snapshot, but never a half updated one. Code, which reads several options
+# that belong together, should take one snapshot and read all of them from it.
+import json
+import tempfile
+import threading
+from collections.abc import Mapping
+from time import sleep
+
+
+class ReloadingConfig:
+    """layered options from files, which are reloaded when they change"""
+    def __init__(self, *paths, interval=1.0, parse=json.loads):
+        self._paths = paths  # the first file wins, like in ChainMap
+        self._interval = interval
+        self._parse = parse
+        self._stamps = [None] * len(paths)
+        self._layers = [{} for _ in paths]
+        self.errors = {}  # path -> the error of the last failed reload
+        # (None -> the error, if building the snapshot failed)
+        self.snapshot = LayeredConfig()
+        self._reload()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def _reload(self):
+        changed = False
+        for i, path in enumerate(self._paths):
+            try:
+                stat = os.stat(path)
+                stamp = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                stamp = None
+            if stamp == self._stamps[i]:
+                continue
+            try:
+                if stamp is None:
+                    layer = {}  # a missing file is an empty layer
+                else:
+                    with open(path) as h:
+                        layer = self._parse(h.read())
+                    if not isinstance(layer, Mapping):  # e.g. [1, 2]
+                        raise TypeError(f"{path} contains a "
+                                        f"{type(layer).__name__}, not a mapping")
+            except (OSError, ValueError, TypeError) as ex:
+                self.errors[path] = ex  # keep the old layer
+                continue
+            self.errors.pop(path, None)
+            self._stamps[i] = stamp
+            self._layers[i] = layer
+            changed = True
+        if changed:
+            snapshot = LayeredConfig(*self._layers)  # built aside ...
+            snapshot.version = self.snapshot.version + 1
+            self.snapshot = snapshot  # ... and swapped in at once
+            self.errors.pop(None, None)
+
+    def _watch(self):
+        while not self._stop.wait(self._interval):
+            try:
+                self._reload()
+            except Exception as ex:  # the thread must survive, so that the
+                self.errors[None] = ex  # next change of a file is picked up
+
+    def __getitem__(self, key):
+        return self.snapshot[key]
+
+    def get(self, key, default=None):
+        return self.snapshot.get(key, default)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+with tempfile.TemporaryDirectory() as directory:
+    cmd_file = os.path.join(directory, "cmd.json")
+    default_file = os.path.join(directory, "default.json")
+    with open(default_file, "w") as h:
+        json.dump(default_options, h)
+    with ReloadingConfig(cmd_file, default_file, interval=0.05) as options:
+        print(options["debug"], options.snapshot.version)
+        with open(cmd_file, "w") as h:
+            json.dump(cmd_options, h)
+        sleep(0.2)  # the background thread picks up the new file
+        print(options["user"], options.snapshot.version)
+
 # tuple unpacking. tuples have a superpower called tuple unpacking. You already
 # saw it multiple times, when we were iterating over a collection in a for loop
 # See how it works
@@ -161,6 +161,91 @@ class SquareValues:
 for i in SquareValues(10):
     print(i)
 
+# SquareValues stores its position on the instance and returns self from
+# __iter__. So it can only be used once and two loops over the same object
+# would steal values from each other. range does it better: a range is a
+# sequence, which knows its length, can be indexed and sliced and every
+# iter(range) gets its own independent iterator. And it never stores its
+# values, it calculates them on demand.
+# Let's build SquareSequence on top of a range. Sequence from collections.abc
+# fills in index and count for us, if we provide __len__ and __getitem__, but
+# we provide faster versions of the other methods ourselves.
+from collections.abc import Sequence
+from math import isqrt
+
+
+class SquareSequence(Sequence):
+    """the square values of range(stop) or of a slice of it"""
+    __slots__ = ["_range"]
+    def __init__(self, stop):
+        self._range = stop if isinstance(stop, range) else range(stop)
+        if self._range and min(self._range[0], self._range[-1]) < 0:
+            # (-2)**2 == 2**2, our shortcuts below only work for roots >= 0
+            raise ValueError("SquareSequence needs a range without negatives")
+
+    def __len__(self):
+        return len(self._range)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return SquareSequence(self._range[index])  # range slices are O(1)
+        return self._range[index] ** 2
+
+    def __iter__(self):  # a new, independent iterator on every call
+        return (i * i for i in self._range)
+
+    def __reversed__(self):
+        return (i * i for i in reversed(self._range))
+
+    def _root(self, value):
+        # no scan: a square has an integer square root, which must be in range
+        if not isinstance(value, int):
+            # like range, accept numbers which are equal to an int, e.g. 4.0
+            try:
+                as_int = int(value)
+            except (TypeError, ValueError, OverflowError):
+                return None
+            if as_int != value:
+                return None
+            value = as_int
+        if value < 0:
+            return None
+        root = isqrt(value)
+        if root * root == value and root in self._range:
+            return root
+        return None
+
+    def __contains__(self, value):
+        return self._root(value) is not None
+
+    def index(self, value):
+        root = self._root(value)
+        if root is None:
+            raise ValueError(f"{value} is not in SquareSequence")
+        return self._range.index(root)
+
+    def count(self, value):
+        return int(value in self)
+
+    def __eq__(self, other):
+        if not isinstance(other, SquareSequence):
+            return NotImplemented
+        return self._range == other._range
+
+    def __hash__(self):
+        return hash(self._range)
+
+    def __repr__(self):
+        return f"SquareSequence({self._range!r})"
+
+
+squares = SquareSequence(10**12)
+print(len(squares), squares[-1], squares[10:20:3], list(squares[10:20:3]))
+print(10**6 in squares, 10**6 + 1 in squares, squares.index(144))
+first, second = iter(squares), iter(squares)
+print(next(first), next(first), next(second))  # they don't interfere
+print(list(reversed(squares[:4])))
+
 
 # The python interpreter knows one more way to produce an iterator.
 # Every object which implements __len__ and __getitem__ is an iterator, too.
@@ -189,6 +274,250 @@ for i in container:
 # values from a list or dictionary for example. With both this methods present,
 # the python interpreter can figure out, how to iterate over the object
 
+# MyContainer has no __iter__, so the for loop falls back to calling
+# __getitem__ with 0, 1, 2, ... until an IndexError is raised. And slicing the
+# wrapped list copies all selected elements into a new list.
+# If all elements have the same type (e.g. float), they can be stored as raw
+# numbers in an array from the array module. A memoryview on the array exposes
+# the numbers through the buffer protocol: slicing a memoryview doesn't copy,
+# it creates a new view on the same memory. And everything, which understands
+# the buffer protocol (file.write, struct, numpy, bytes, ...) can use it
+# directly without a copy.
+from array import array
+
+
+class ArrayContainer:
+    """a typed container, whose slices are views instead of copies"""
+    __slots__ = ["_view"]
+    def __init__(self, values, typecode="d"):
+        if isinstance(values, memoryview):
+            self._view = values
+        else:
+            self._view = memoryview(array(typecode, values))
+
+    def __len__(self):
+        return len(self._view)
+
+    def __getitem__(self, index):
+        item = self._view[index]
+        if isinstance(index, slice):
+            return ArrayContainer(item)  # shares the memory with self
+        return item
+
+    def __setitem__(self, index, value):
+        self._view[index] = value
+
+    def __iter__(self):  # the memoryview iterator is implemented in C
+        return iter(self._view)
+
+    def __buffer__(self, flags):  # python 3.12+ lets us use memoryview(container)
+        return self._view
+
+    @property
+    def view(self):  # for older pythons
+        return self._view
+
+    def __repr__(self):
+        return f"ArrayContainer({self._view.tolist()!r}, {self._view.format!r})"
+
+
+container = ArrayContainer([1, 2, 3, 4, 5])
+tail = container[2:]
+tail[0] = 42  # writes into container, too
+print(container, tail, sum(container))
+import io
+h = io.BytesIO()  # works the same for files opened in "wb" mode
+h.write(container.view)  # the raw bytes, no copy
+print(len(h.getvalue()), "bytes written")
+# with numpy: numpy.asarray(container.view) shares the memory, too
+
+# map, filter and friends compose nicely, but nested calls are read inside
+# out: map(g, filter(p, map(f, source))). Let's build a small Pipeline class,
+# which lets you write the same thing from left to right:
+# Pipeline(source).map(f).filter(p).map(g)
+# Every method returns a new Pipeline and nothing is computed, before you
+# iterate over it. So it is as lazy as the iterators it is made of and it
+# works with infinite sources like count(), too.
+# How do we run the stages? If every stage was a generator function, each item
+# would pass through one python generator frame per stage. Fusing all stages
+# into one generator expression saves some of these frame switches, but the
+# builtin map and filter have no python frame at all, they are implemented in
+# C. So Pipeline simply turns its stages into a chain of builtins, once per
+# iteration, and then gets out of the way.
+from itertools import islice
+
+
+class Pipeline:
+    """a lazy chain of iterator stages, read from left to right"""
+    def __init__(self, source, stages=()):
+        self._source = source
+        self._stages = stages  # tuples of (kind, argument)
+
+    def _then(self, kind, argument):
+        return Pipeline(self._source, self._stages + ((kind, argument),))
+
+    def map(self, func):
+        return self._then("map", func)
+
+    def filter(self, predicate):
+        return self._then("filter", predicate)
+
+    def batch(self, n):
+        return self._then("batch", n)  # lists of up to n items
+
+    def take(self, k):
+        return self._then("take", k)  # stops after the first k items
+
+    def __iter__(self):
+        iterator = iter(self._source)
+        for kind, argument in self._stages:
+            if kind == "map":
+                iterator = map(argument, iterator)
+            elif kind == "filter":
+                iterator = filter(argument, iterator)
+            elif kind == "batch":
+                iterator = iter(partial(_next_batch, iterator, argument), [])
+            else:
+                iterator = islice(iterator, argument)
+        return iterator
+
+    def __repr__(self):
+        stages = "".join(f".{kind}({argument!r})" for kind, argument in self._stages)
+        return f"Pipeline({self._source!r}){stages}"
+
+
+def _next_batch(iterator, n):
+    return list(islice(iterator, n))
+
+
+pipeline = Pipeline(count()).filter(less_than_3).map(lambda x: x**2).take(2)
+print(pipeline)
+print(list(pipeline))
+print(list(Pipeline(range(10)).filter(lambda x: x > 5).map(str).batch(3)))
+
+# the batch stage uses iter with two arguments (see s0_utilities.py): it calls
+# _next_batch until it returns the sentinel, an empty list.
+
+# Let's measure it. We compare the nested builtins with the Pipeline and with
+# one generator per stage. The stage functions are bound methods of ints, which
+# are implemented in C, too. So we measure the cost of passing items from stage
+# to stage and not the cost of calling lambdas.
+from timeit import timeit
+
+
+def map_stage(func, iterator):
+    for item in iterator:
+        yield func(item)
+
+
+def filter_stage(predicate, iterator):
+    for item in iterator:
+        if predicate(item):
+            yield item
+
+inc = (1).__add__  # x + 1
+odd = (2).__rmod__  # x % 2
+double = (2).__mul__  # x * 2
+n = 100_000
+candidates = {
+    "builtins": lambda: sum(map(double, filter(odd, map(inc, range(n))))),
+    "pipeline": lambda: sum(Pipeline(range(n)).map(inc).filter(odd).map(double)),
+    "generator per stage": lambda: sum(map_stage(double, filter_stage(odd, map_stage(inc, range(n))))),
+}
+for name, candidate in candidates.items():
+    seconds = min(timeit(candidate, number=5) for _ in range(3)) / 5
+    print(f"{name:20} {seconds / n * 1e9:6.1f} ns per item")
+
+# The Pipeline costs the same as the nested builtins, the stages are set up
+# only once per iteration. One generator per stage is slower, because every
+# item switches into and out of one python frame per stage.
+
+# map runs on one core. For cpu heavy functions we can hand the work to a pool
+# of processes. Sending every single item to another process would cost more
+# than the work itself, so parallel_map cuts the input into chunks (with the
+# same _next_batch as Pipeline.batch), sends whole chunks to the workers and
+# yields the results lazily. Only max_in_flight chunks are submitted at once.
+# So the input is never loaded into memory as a whole, not even for
+# range(10**8) or count().
+# With ordered=False, the results of whichever chunk finishes first are
+# yielded first.
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+
+def _map_chunk(func, chunk):
+    return list(map(func, chunk))
+
+
+def parallel_map(func, iterable, chunksize=10_000, executor=None, ordered=True,
+                 max_in_flight=None):
+    # func must be picklable (a module level function, not a lambda), if
+    # executor is a ProcessPoolExecutor. By default we use one.
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor()
+    if max_in_flight is None:
+        max_in_flight = 2 * (os.cpu_count() or 1)
+    chunks = iter(partial(_next_batch, iter(iterable), chunksize), [])
+    pending = deque() if ordered else set()
+    try:
+        for chunk in chunks:
+            if len(pending) >= max_in_flight:
+                yield from _done_chunk(pending, ordered)
+            future = executor.submit(_map_chunk, func, chunk)
+            if ordered:
+                pending.append(future)
+            else:
+                pending.add(future)
+        while pending:
+            yield from _done_chunk(pending, ordered)
+    finally:  # e.g. the caller stopped iterating early
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown()
+
+
+def _done_chunk(pending, ordered):
+    if ordered:
+        return pending.popleft().result()
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    results = []
+    for future in done:
+        pending.remove(future)
+        results.extend(future.result())
+    return results
+
+
+def square(x):
+    return x**2
+
+# the pools start only under if __name__ == "__main__": (see s0_utilities.py)
+if __name__ == "__main__":
+    print(sum(parallel_map(square, range(1_000_000), chunksize=100_000)))
+    print(sum(map(square, range(1_000_000))))
+
+# squaring a number is so cheap, that sending the numbers to another process
+# and the results back costs more than squaring them. parallel_map pays off,
+# when every item needs real work. Then the time shrinks with the number of
+# cores:
+from time import perf_counter
+
+
+def slow_square(x):
+    for _ in range(200):
+        x = (x * x) % 1_000_003
+    return x
+
+if __name__ == "__main__":
+    for workers in sorted({1, 2, os.cpu_count() or 1}):
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            start = perf_counter()
+            total = sum(parallel_map(slow_square, range(100_000), chunksize=5_000,
+                                     executor=executor, ordered=False))
+            print(f"{workers} workers: {perf_counter() - start:.2f}s")
+
 # you may want to explore the builtin itertools and 3rd party more-itertools
 # packages, which provide lots of usefull functions, when working with
 # iterators
@@ -97,28 +97,54 @@ def filehandler(filename):
     f2(h)
 
 # lets define a contextmanager to handle the next call
+from inspect import isasyncgenfunction
 
-class MyCtx:
-    def __init__(self, handler_func):
-        self._handler_func = handler_func
-
-    def __call__(self, filename):  # __call__ is invoked if you use a class
-        # instance like a function and try to call it 
-        # ctx = MyCtx(42)
-        # ctx("hello")
-        self._handler_func = self._handler_func(filename)
-        return self
+class GeneratorCtx:
+    __slots__ = ["_generator"]  # one small object per with statement
+    def __init__(self, generator):
+        self._generator = generator
 
     def __enter__(self):
-        return next(self._handler_func)
+        return next(self._generator)
 
     def __exit__(self, type, value, traceback):
         try:
-            next(self._handler_func)
+            next(self._generator)
         except StopIteration:
             pass
 
 
+class AsyncGeneratorCtx:
+    __slots__ = ["_generator"]  # the same for async def handlers (see below)
+    def __init__(self, generator):
+        self._generator = generator
+
+    async def __aenter__(self):
+        return await anext(self._generator)
+
+    async def __aexit__(self, type, value, traceback):
+        try:
+            await anext(self._generator)
+        except StopAsyncIteration:
+            pass
+
+
+class MyCtx:
+    def __init__(self, handler_func):
+        self._handler_func = handler_func
+        self._ctx_type = (AsyncGeneratorCtx if isasyncgenfunction(handler_func)
+                          else GeneratorCtx)
+
+    def __call__(self, *args, **kwargs):  # __call__ is invoked if you use a
+        # class instance like a function and try to call it
+        # ctx = MyCtx(42)
+        # ctx("hello")
+        # every call gets its own generator in its own GeneratorCtx. MyCtx
+        # itself never changes, so the decorated function can be used again
+        # and again, nested and from many threads at the same time
+        return self._ctx_type(self._handler_func(*args, **kwargs))
+
+
 filehandler = MyCtx(filehandler)
 with filehandler("data.txt") as h:
     print(h.read())
@@ -143,6 +169,358 @@ def filehandler(filename):
 with filehandler("data.txt") as h:
     print(h.read())
 
+# h.read() reads the whole file into memory. That is fine for data.txt, but not
+# for a file with several gigabytes. So let's write a filehandler which hands
+# out a stream instead. The stream reads the file chunk by chunk into one
+# bytearray, which is allocated once and reused for every chunk. No matter how
+# big the file is, the memory stays at chunk_size (plus the longest line, if
+# you iterate over lines).
+
+
+class ChunkStream:
+    """reads a binary file chunk by chunk into one reusable buffer"""
+    __slots__ = ["_file", "_buffer"]
+    def __init__(self, file, chunk_size=64 * 1024):
+        self._file = file
+        self._buffer = bytearray(chunk_size)
+
+    def chunks(self):
+        # each chunk is a memoryview on the shared buffer and only valid until
+        # the next chunk is read. Use bytes(chunk) if you want to keep it.
+        view = memoryview(self._buffer)
+        while True:
+            n = self._file.readinto(self._buffer)
+            if not n:
+                break
+            yield view[:n]
+
+    def lines(self):
+        # lines must be separate objects, but only one chunk of them exists
+        # at a time. The start of a line, which spans several chunks, is
+        # collected in pieces and joined once, when its end arrives
+        pieces = []
+        for chunk in self.chunks():
+            lines = bytes(chunk).split(b"\n")
+            rest = lines.pop()
+            if lines:
+                if pieces:
+                    pieces.append(lines[0])
+                    lines[0] = b"".join(pieces)
+                    pieces = []
+                for line in lines:
+                    yield line + b"\n"
+            if rest:
+                pieces.append(rest)
+        if pieces:
+            yield b"".join(pieces)
+
+    def __iter__(self):
+        return self.lines()
+
+
+@MyCtx
+def streamhandler(filename):
+    h = open(filename, "rb", buffering=0)  # readinto fills our buffer directly
+    try:
+        yield ChunkStream(h)
+    finally:
+        h.close()
+
+with streamhandler("data.txt") as stream:
+    for line in stream:
+        print(line.decode())
+
+# For random access in a big file, reading chunk after chunk does not help.
+# mmap maps the file into memory and lets the operating system load only the
+# pages which we touch. A memoryview on the map gives us slices without
+# copying a single byte. A map can only be closed, when no view on it is
+# alive anymore. So MappedFile remembers every view it hands out (weakly, so
+# that views can be garbage collected) and releases them all when it closes.
+import mmap
+import os
+import weakref
+
+
+class MappedFile:
+    """a memory mapped, read only file which hands out zero copy views"""
+    __slots__ = ["_mmap", "_view", "_exported"]
+    def __init__(self, file):
+        if os.fstat(file.fileno()).st_size:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:  # an empty file can't be mapped, empty bytes do the same job
+            self._mmap = b""
+        self._view = memoryview(self._mmap)
+        self._exported = weakref.WeakSet()
+
+    def __len__(self):
+        return len(self._view)
+
+    def __getitem__(self, index):  # a slice returns a view, not a copy
+        item = self._view[index]
+        if isinstance(item, memoryview):
+            self._exported.add(item)
+        return item
+
+    def find(self, sub, start=0, end=None):
+        return self._mmap.find(sub, start, len(self) if end is None else end)
+
+    def line_at(self, offset):
+        # the line, which contains the byte at offset (without b"\n")
+        if not 0 <= offset < len(self):  # e.g. find returned -1
+            raise IndexError("MappedFile offset out of range")
+        start = self._mmap.rfind(b"\n", 0, offset) + 1
+        end = self._mmap.find(b"\n", offset)
+        return self[start:len(self) if end < 0 else end]
+
+    def line_offsets(self):
+        # the offset of the first byte of every line
+        offset = 0
+        while offset < len(self):
+            yield offset
+            offset = self._mmap.find(b"\n", offset) + 1
+            if not offset:
+                break
+
+    def close(self):
+        for view in list(self._exported):
+            view.release()
+        self._view.release()
+        if isinstance(self._mmap, mmap.mmap):
+            try:
+                self._mmap.close()
+            except BufferError:
+                # a view of one of our views (m[0:20][4:8]) is still alive. We
+                # can't unmap now and must not hide an exception of the with
+                # body. Python unmaps, when the last view is garbage collected
+                self._mmap = None
+
+
+@MyCtx
+def mmaphandler(filename):
+    h = open(filename, "rb")
+    try:
+        mapped = MappedFile(h)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+    finally:
+        h.close()
+
+with mmaphandler("data.txt") as m:
+    offset = m.find(b"secret")
+    print(offset, bytes(m.line_at(offset)), list(m.line_offsets()))
+
+# Because MyCtx creates a fresh GeneratorCtx for every call, filehandler can
+# be used by many threads at once. Let's stress it: 32 threads open 10000
+# contexts and each one checks, that it got its own file handle.
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+
+def read_secret(_):
+    with filehandler("data.txt") as h:
+        return h, h.read()
+
+start = perf_counter()
+with ThreadPoolExecutor(max_workers=32) as pool:
+    results = list(pool.map(read_secret, range(10_000)))
+seconds = perf_counter() - start
+handles = {id(h) for h, _ in results}
+assert all(h.closed for h, _ in results)
+assert all(content == results[0][1] for _, content in results)
+print(f"{len(results)} contexts in {seconds:.2f}s "
+      f"({len(results) / seconds:.0f} per second), "
+      f"{len(handles)} distinct handles, all closed")
+
+# Greeter and filehandler acquire a new resource on every with statement and
+# release it at the end. If you open the same kind of handle thousands of
+# times per second, opening and closing costs more than the actual work.
+# A pool keeps a couple of warm resources around and lends them out. The
+# with statement works exactly the same, only __exit__ gives the resource back
+# to the pool instead of closing it.
+import threading
+from collections import deque
+from time import monotonic, sleep
+
+
+class PoolLease:
+    __slots__ = ["_pool", "_timeout", "_resource"]
+    def __init__(self, pool, timeout):
+        self._pool = pool
+        self._timeout = timeout
+        self._resource = None
+
+    def __enter__(self):
+        self._resource = self._pool.checkout(self._timeout)
+        return self._resource
+
+    def __exit__(self, type, value, traceback):
+        resource, self._resource = self._resource, None
+        self._pool.checkin(resource)
+
+
+class Pool:
+    """lends out up to max_size warm resources"""
+    def __init__(self, create, close=lambda resource: resource.close(),
+                 check=None, max_size=8, idle_timeout=60.0):
+        self._create = create  # makes a new resource
+        self._close = close  # destroys a resource
+        self._check = check  # returns False, if a resource is broken
+        self._max_size = max_size
+        self._idle_timeout = idle_timeout
+        self._idle = deque()  # (resource, returned_at), newest on the right
+        self._size = 0  # idle and lent out resources
+        self._closed = False
+        self._condition = threading.Condition()
+        self._started = self._changed = monotonic()
+        self._in_use = 0
+        self._in_use_seconds = 0.0
+        self._stats = {"checkouts": 0, "created": 0, "discarded": 0,
+                       "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+    def __call__(self, timeout=None):
+        return PoolLease(self, timeout)
+
+    def _count_in_use(self, delta):  # call with the condition held
+        now = monotonic()
+        self._in_use_seconds += self._in_use * (now - self._changed)
+        self._changed = now
+        self._in_use += delta
+
+    def _discard(self, resource):
+        self._close(resource)
+        with self._condition:
+            self._stats["discarded"] += 1
+
+    def checkout(self, timeout=None):
+        start = monotonic()
+        expired = []
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("the pool is closed")
+                now = monotonic()
+                while self._idle and now - self._idle[0][1] > self._idle_timeout:
+                    expired.append(self._idle.popleft()[0])
+                    self._size -= 1
+                if self._idle:
+                    resource = self._idle.pop()[0]  # the warmest one
+                    break
+                if self._size < self._max_size:
+                    resource = None
+                    self._size += 1
+                    break
+                remaining = None if timeout is None else timeout - (now - start)
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("no resource available in the pool")
+                self._condition.wait(remaining)
+            waited = monotonic() - start
+            self._stats["checkouts"] += 1
+            self._stats["wait_seconds"] += waited
+            self._stats["max_wait_seconds"] = max(waited, self._stats["max_wait_seconds"])
+            self._count_in_use(+1)
+        # slow work like closing, checking and creating is done without the
+        # lock. If any of it fails, we give our slot back to the pool
+        try:
+            self._discard_all(expired)
+            if resource is not None and self._check is not None:
+                try:
+                    healthy = self._check(resource)
+                except BaseException:
+                    self._discard_all([resource])  # don't leak a broken one
+                    raise
+                if not healthy:
+                    self._discard(resource)
+                    resource = None
+            if resource is None:
+                resource = self._create()
+                with self._condition:
+                    self._stats["created"] += 1
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._count_in_use(-1)
+                self._condition.notify()
+            raise
+        return resource
+
+    def _discard_all(self, resources):
+        # closes every resource, even if closing one of them fails. The first
+        # error is raised at the end
+        error = None
+        for resource in resources:
+            try:
+                self._discard(resource)
+            except Exception as ex:
+                error = error or ex
+        if error is not None:
+            raise error
+
+    def checkin(self, resource):
+        with self._condition:
+            closed = self._closed
+            if closed:  # lent out before close, nobody will take it again
+                self._size -= 1
+            else:
+                self._idle.append((resource, monotonic()))
+            self._count_in_use(-1)
+            self._condition.notify()
+        if closed:
+            self._close(resource)
+
+    def metrics(self):
+        with self._condition:
+            self._count_in_use(0)
+            elapsed = self._changed - self._started
+            metrics = dict(self._stats, size=self._size, in_use=self._in_use)
+            metrics["utilisation"] = (self._in_use_seconds / (elapsed * self._max_size)
+                                      if elapsed else 0.0)
+        checkouts = metrics["checkouts"]
+        metrics["mean_wait_seconds"] = metrics["wait_seconds"] / checkouts if checkouts else 0.0
+        return metrics
+
+    def close(self):
+        # idle resources are closed now, lent out ones when they come back
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+            self._condition.notify_all()  # waiting checkouts fail
+        for resource, _ in idle:
+            self._close(resource)
+
+
+# a stand in for a remote service, connecting to it takes a while
+class FakeConnection:
+    def __init__(self):
+        sleep(0.01)
+        self.alive = True
+
+    def query(self, value):
+        return value * 2
+
+    def close(self):
+        self.alive = False
+
+
+connections = Pool(FakeConnection, check=lambda c: c.alive, max_size=4,
+                   idle_timeout=5.0)
+
+
+def query(value):
+    with connections() as connection:
+        return connection.query(value)
+
+with ThreadPoolExecutor(max_workers=16) as executor:
+    print(sum(executor.map(query, range(10_000))))
+print(connections.metrics())
+connections.close()
+
+# only 4 connections were created for 10000 queries. The metrics tell you, how
+# long callers had to wait for a free connection and how busy the pool was. If
+# the utilisation is close to 1 and the wait times grow, increase max_size.
+
 # now we can easily build our own context managers with MyCtx. We just wrap a
 # generator function which yields exactly ones and we are done. And 
 # contextlib already contains a decorator for exactly this purpose 
@@ -161,6 +539,33 @@ def greet(arg):
 with greet("Joe") as g:
     print(g)
 
+# MyCtx works for async generator functions (async def with yield), too. The
+# async with statement calls __aenter__ and __aexit__, which let the event loop
+# run other tasks, while we wait for the handler. The handler behaves just like
+# its sync counterpart: the finally clause runs on exit, even if the body of
+# the async with statement raised an exception, and the exception propagates.
+import asyncio
+
+
+@MyCtx
+async def async_filehandler(filename):
+    h = await asyncio.to_thread(open, filename)  # opening might block
+    try:
+        yield h
+    finally:
+        await asyncio.to_thread(h.close)
+
+
+async def read_file(filename):
+    async with async_filehandler(filename) as h:
+        return await asyncio.to_thread(h.read)
+
+
+async def main():
+    print(await asyncio.gather(read_file("data.txt"), read_file("data.txt")))
+
+asyncio.run(main())
+
 
 # You have learned how context managers work and you have learned how to
 # combine them with generator functions and decorators to build expressive and
@@ -0,0 +1,257 @@
+# "smaller and faster" is a claim. Let's measure it instead of believing it.
+# s4_classes_again.py is a lecture, which is full of intentional mistakes, so
+# python can't even compile it. That's why the benchmark lives in its own
+# module, together with a copy of the Circle versions 0.8, 0.9, 0.10 and 0.11.
+# CircleArray and cached_method are imported from s4_circle_tools.py.
+# Run it with
+#   python s4_circle_benchmark.py [n] [results.json]
+# It builds each version and reports how fast it is and how much memory it
+# needs. Every variant runs in its own fresh python process, so the growth of
+# the peak RSS (resident set size) belongs to that variant alone. Like
+# bytes_per_million (measured with tracemalloc), it is scaled to one million
+# circles, and the interpreter's own memory is subtracted. The results are
+# printed as json, so you can store them and compare them with the next run to
+# spot regressions.
+import json
+import math
+import subprocess
+import sys
+import timeit
+import tracemalloc
+
+from s4_circle_tools import CircleArray, cached_method
+
+try:
+    import resource
+except ImportError:  # resource is only available on unix
+    resource = None
+
+
+class Circle08:
+    """the best circle in the world"""
+    version = "0.8"
+    def __init__(self, radius):
+        self.radius = radius
+
+    @classmethod
+    def from_perimeter(cls, perimeter):
+        return cls(perimeter / 2 / math.pi)
+
+    def perimeter(self):
+        return math.pi * self.radius * 2
+
+    __perimeter = perimeter
+
+    def area(self):
+        p = self.__perimeter()
+        r = p / 2 / math.pi
+        return math.pi * r ** 2
+
+
+class Circle09:
+    """the best circle in the world"""
+    version = "0.9"
+    def __init__(self, radius):
+        self.radius = radius
+
+    @property
+    def radius(self):
+        return self.diameter / 2
+
+    @radius.setter
+    def radius(self, radius):
+        self.diameter = 2 * radius
+
+    @classmethod
+    def from_perimeter(cls, perimeter):
+        return cls(perimeter / 2 / math.pi)
+
+    def perimeter(self):
+        return math.pi * self.radius * 2
+
+    __perimeter = perimeter
+
+    def area(self):
+        p = self.__perimeter()
+        r = p / 2 / math.pi
+        return math.pi * r ** 2
+
+
+class Circle10:
+    """the best circle in the world"""
+    version = "0.10"
+    __slots__ = ["diameter"]
+    def __init__(self, radius):
+        self.radius = radius
+
+    @property
+    def radius(self):
+        return self.diameter / 2
+
+    @radius.setter
+    def radius(self, radius):
+        self.diameter = 2 * radius
+
+    @classmethod
+    def from_perimeter(cls, perimeter):
+        return cls(perimeter / 2 / math.pi)
+
+    def perimeter(self):
+        return math.pi * self.radius * 2
+
+    __perimeter = perimeter
+
+    def area(self):
+        p = self.__perimeter()
+        r = p / 2 / math.pi
+        return math.pi * r ** 2
+
+
+class Circle11:
+    """the best circle in the world"""
+    version = "0.11"
+    __slots__ = ["_diameter", "_Circle11_perimeter", "_Circle11_area"]
+    def __init__(self, radius):
+        self._diameter = 2 * radius  # nothing cached yet, skip the setter
+
+    def __getattr__(self, name):  # only called, if a slot is empty
+        return cached_method.compute(self, name)
+
+    @property
+    def diameter(self):
+        return self._diameter
+
+    @diameter.setter
+    def diameter(self, diameter):
+        self._diameter = diameter
+        cached_method.invalidate(self)
+
+    @property
+    def radius(self):
+        return self._diameter / 2
+
+    @radius.setter
+    def radius(self, radius):
+        self.diameter = 2 * radius
+
+    @classmethod
+    def from_perimeter(cls, perimeter):
+        return cls(perimeter / 2 / math.pi)
+
+    @cached_method
+    def perimeter(self):
+        return math.pi * self.radius * 2
+
+    __perimeter = perimeter
+
+    @cached_method
+    def area(self):
+        p = self.__perimeter()
+        r = p / 2 / math.pi
+        return math.pi * r ** 2
+
+
+circle_versions = {cls.version: cls
+                   for cls in (Circle08, Circle09, Circle10, Circle11)}
+
+
+def _peak_rss():
+    # ru_maxrss is in kilobytes on linux
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _rss_per_million(build, n):
+    # how much the peak RSS grows, while build() creates n circles. Run it
+    # first, before anything else in the process raised the peak. ru_maxrss
+    # counts whole pages, so use a big n for small circles
+    if resource is None:
+        return None
+    baseline = _peak_rss()
+    circles = build()
+    grown = _peak_rss() - baseline
+    del circles
+    return grown * 1_000_000 / n
+
+
+def _per_call_ns(stmt, namespace, number):
+    # best of 3 runs, in nanoseconds per call
+    timer = timeit.Timer(stmt, globals=namespace)
+    return min(timer.repeat(repeat=3, number=number)) / number * 1e9
+
+
+def benchmark_circle(cls, n=100_000):
+    rss = _rss_per_million(lambda: [cls(1) for _ in range(n)], n)
+    namespace = {"cls": cls, "n": n, "c": cls(1)}
+    scale = 1_000_000 / n
+    tracemalloc.start()
+    circles = [cls(1) for _ in range(n)]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del circles
+    construct_ns = _per_call_ns("[cls(1) for _ in range(n)]", namespace, 1) / n
+    return {
+        "constructions_per_s": 1e9 / construct_ns,
+        "radius_get_ns": _per_call_ns("c.radius", namespace, n),
+        "radius_set_ns": _per_call_ns("c.radius = 2", namespace, n),
+        "area_ns": _per_call_ns("c.area()", namespace, n),
+        "bytes_per_million": peak * scale,
+        "peak_rss_bytes_per_million": rss,
+    }
+
+
+def benchmark_circle_array(n=100_000):
+    radii = [1] * n
+    rss = _rss_per_million(lambda: CircleArray(radii), n)
+    namespace = {"CircleArray": CircleArray, "radii": radii}
+    namespace["c"] = CircleArray(namespace["radii"])
+    scale = 1_000_000 / n
+    tracemalloc.start()
+    circles = CircleArray(namespace["radii"])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del circles
+    # the columnar version works on all n circles per call, so every timing is
+    # divided by n to be comparable with the per object numbers
+    construct_ns = _per_call_ns("CircleArray(radii)", namespace, 10) / n
+    return {
+        "constructions_per_s": 1e9 / construct_ns,
+        "radius_get_ns": _per_call_ns("c.radius", namespace, 10) / n,
+        "radius_set_ns": _per_call_ns("c.radius = radii", namespace, 10) / n,
+        "area_ns": _per_call_ns("c.area()", namespace, 10) / n,
+        "bytes_per_million": peak * scale,
+        "peak_rss_bytes_per_million": rss,
+    }
+
+
+def benchmark_variant(name, n=100_000):
+    # runs in the child process, see run_circle_benchmarks
+    if name == "CircleArray":
+        return benchmark_circle_array(n)
+    return benchmark_circle(circle_versions[name.split()[-1]], n)
+
+
+def run_circle_benchmarks(n=100_000, path=None):
+    variants = [f"Circle {version}" for version in circle_versions]
+    variants.append("CircleArray")
+    results = {}
+    for name in variants:
+        child = subprocess.run(
+            [sys.executable, __file__, "--variant", name, str(n)],
+            check=True, capture_output=True, text=True)
+        results[name] = json.loads(child.stdout)
+    if path is not None:
+        with open(path, "w") as h:
+            json.dump(results, h, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--variant"]:
+        name, n = sys.argv[2], int(sys.argv[3])
+        print(json.dumps(benchmark_variant(name, n)))
+    else:
+        n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+        path = sys.argv[2] if len(sys.argv) > 2 else None
+        print(json.dumps(run_circle_benchmarks(n, path), indent=2))
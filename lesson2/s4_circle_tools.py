@@ -0,0 +1,175 @@
+# The columnar circles and cached_method from s4_classes_again.py. They live
+# in their own module, so that s4_circle_benchmark.py can import them
+# (s4_classes_again.py doesn't compile).
+import math
+from array import array
+from itertools import repeat
+from operator import attrgetter
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, fall back to the array module
+    np = None
+
+
+def _as_column(values, factor=1.0):
+    # one contiguous float64 buffer, scaled by factor
+    if np is not None:
+        return np.asarray(values, dtype=np.float64) * factor
+    return array("d", (value * factor for value in values))
+
+
+class CircleView:
+    """one circle, which lives inside a CircleArray"""
+    version = "0.10"
+    __slots__ = ["_diameters", "_index"]
+    def __init__(self, diameters, index):
+        self._diameters = diameters
+        self._index = index
+
+    @property
+    def diameter(self):
+        return self._diameters[self._index]
+
+    @diameter.setter
+    def diameter(self, diameter):
+        self._diameters[self._index] = diameter
+
+    @property
+    def radius(self):
+        return self.diameter / 2
+
+    @radius.setter
+    def radius(self, radius):
+        self.diameter = 2 * radius
+
+    def perimeter(self):
+        return math.pi * self.radius * 2
+
+    __perimeter = perimeter
+
+    def area(self):
+        p = self.__perimeter()
+        r = p / 2 / math.pi
+        return math.pi * r ** 2
+
+    @staticmethod
+    def grad_to_rad(grad):
+        return grad / (2 * math.pi)
+
+    def __repr__(self):
+        return f"CircleView(radius={self.radius})"
+
+
+class CircleArray:
+    """lots of the best circles in the world"""
+    version = "0.10"
+    __slots__ = ["_diameters"]
+    def __init__(self, radii):
+        self._diameters = _as_column(radii, 2.0)
+
+    @property
+    def radius(self):
+        return _as_column(self._diameters, 0.5)
+
+    @radius.setter
+    def radius(self, radii):
+        diameters = _as_column(radii, 2.0)
+        if len(diameters) != len(self._diameters):
+            raise ValueError("the number of radii must not change")
+        self._diameters[:] = diameters  # update in place, views stay valid
+
+    @classmethod
+    def from_perimeters(cls, perimeters):
+        return cls(_as_column(perimeters, 1 / 2 / math.pi))
+
+    def perimeter(self):
+        return _as_column(self._diameters, math.pi)
+
+    def area(self):
+        # the law still wants the area from the perimeter, but for the whole
+        # column at once: pi * (p / 2 / pi) ** 2 == p * p / (4 * pi)
+        if np is not None:
+            p = self.perimeter()
+            return p * p / (4 * math.pi)
+        # without numpy every element costs a python loop step anyway, so at
+        # least make it a single pass: p * p / (4 * pi) == d * d * pi / 4
+        factor = math.pi / 4
+        return array("d", (d * d * factor for d in self._diameters))
+
+    grad_to_rad = staticmethod(CircleView.grad_to_rad)
+
+    def __len__(self):
+        return len(self._diameters)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):  # a list of views, which write through
+            return [CircleView(self._diameters, i)
+                    for i in range(*index.indices(len(self._diameters)))]
+        if index < 0:
+            index += len(self._diameters)
+        if not 0 <= index < len(self._diameters):
+            raise IndexError("CircleArray index out of range")
+        return CircleView(self._diameters, index)
+
+    def __iter__(self):
+        for index in range(len(self._diameters)):
+            yield CircleView(self._diameters, index)
+
+
+class cached_method(property):
+    """remembers the result of a method without arguments per instance"""
+    def __init__(self, func):
+        super().__init__()  # the getter follows in __set_name__
+        self.slot = None
+        self.func = func
+        self.__doc__ = func.__doc__
+
+    def __set_name__(self, owner, name):
+        # python calls this for every cached_method in the class body. The
+        # result is stored in a slot named after the class and the method,
+        # e.g. Circle.area -> _Circle_area. The class must declare it in
+        # __slots__. If the method gets a second name (__perimeter =
+        # perimeter), the first one wins
+        if self.slot is None:
+            self.slot = f"_{owner.__name__}_{name}"
+            if not hasattr(owner, self.slot):
+                raise TypeError(f"{owner.__name__} must declare "
+                                f"{self.slot!r} in __slots__")
+            super().__init__(attrgetter(self.slot))
+            self.__doc__ = self.func.__doc__
+        # we collect the slots in owner._cached_slots (which starts with the
+        # slots of the base classes), so invalidate knows what to empty
+        slots = owner.__dict__.get("_cached_slots")
+        if slots is None:
+            slots = owner._cached_slots = [*getattr(owner, "_cached_slots", ())]
+        if self.slot not in slots:  # __perimeter = perimeter names it twice
+            slots.append(self.slot)
+
+    def __call__(self, instance):  # Circle.perimeter(c) keeps working
+        try:
+            return self.__get__(instance)()
+        except AttributeError:
+            return self.fill(instance)()
+
+    def fill(self, instance):
+        # store a function instead of the value, so c.area() stays a call
+        result = repeat(self.func(instance)).__next__
+        setattr(instance, self.slot, result)
+        return result
+
+    @staticmethod
+    def compute(instance, name):
+        method = getattr(type(instance), name, None)
+        if not isinstance(method, cached_method):
+            raise AttributeError(f"{type(instance).__name__!r} object has "
+                                 f"no attribute {name!r}")
+        return method.fill(instance)
+
+    @staticmethod
+    def invalidate(instance):
+        for slot in instance._cached_slots:
+            try:
+                delattr(instance, slot)
+            except AttributeError:  # was not calculated yet
+                pass
@@ -357,6 +357,121 @@ class Circle:
 print(Circle(1).radius)
 
 
+# But even a slotted Circle is still a full python object. A million circles
+# are a million objects, each with its own header and a boxed float inside. If
+# you always work on lots of circles at once, turn the design inside out:
+# store all diameters in one contiguous buffer (a "column") and let one object
+# represent the whole bunch. numpy is the tool of choice for this, but the
+# array module from the standard library does the job, too.
+# CircleView and CircleArray live in s4_circle_tools.py, have a look at them.
+# The diameters are kept in one column. CircleArray works on the whole column
+# at once and indexing it returns a CircleView, which reads and writes one
+# element of that column.
+from s4_circle_tools import CircleArray, CircleView
+
+circles = CircleArray([1] * 1_000_000)
+print(len(circles), circles[0].radius, circles[-1].area())
+circles.radius = circles.area()  # the whole column in one go
+print(circles[0], circles[-2:])
+
+# All one million diameters now live in 8 MB of contiguous memory (1 object
+# instead of 1 million). Indexing creates a small CircleView, which behaves
+# like a Circle, but writes straight through to the shared buffer. A slice
+# gives you a list of such views.
+# With numpy, area() and perimeter() are a few vector operations, which loop
+# over the whole column in C. Expect them to be an order of magnitude faster
+# than calling area() on every Circle. The array fallback saves the same
+# memory, but it still runs a python loop step per circle: area() is only
+# about 3 times faster than Circle 0.10 and reading all radii costs about as
+# much as reading them one by one (see s4_circle_benchmark.py).
+
+# "smaller and faster" is a claim. Let's measure it instead of believing it.
+# This file doesn't even compile (see Circle 0.7), so the benchmark lives in
+# s4_circle_benchmark.py. It compares the versions 0.8, 0.9, 0.10 and the
+# CircleArray and prints the results as json, so you can store them and
+# compare them with the next run to spot regressions.
+
+# area() still recalculates the perimeter and converts it back to a radius on
+# every call, although a circle hardly ever changes. functools.cached_property
+# would remember the result, but it stores it in the instance __dict__ and our
+# slotted Circle has none. So we build our own cached_method. It is a property
+# which reads the remembered result from an extra slot (one per cached method).
+# The first access finds the slot empty, which makes python call __getattr__,
+# and there we calculate and store the result. Every later access never leaves
+# C code. The diameter setter (and with it the radius setter) empties the
+# slots again.
+# cached_method lives in s4_circle_tools.py, have a look at it. It takes the
+# name of its slot from the class and the method, e.g. Circle.area stores its
+# result in _Circle_area, and the class must declare these slots.
+from s4_circle_tools import cached_method
+
+
+class Circle:
+    """the best circle in the world"""
+    version = "0.11"
+    __slots__ = ["_diameter", "_Circle_perimeter", "_Circle_area"]
+    def __init__(self, radius):
+        self._diameter = 2 * radius  # nothing cached yet, skip the setter
+
+    def __getattr__(self, name):  # only called, if a slot is empty
+        return cached_method.compute(self, name)
+
+    @property
+    def diameter(self):
+        return self._diameter
+
+    @diameter.setter
+    def diameter(self, diameter):
+        self._diameter = diameter
+        cached_method.invalidate(self)
+
+    @property
+    def radius(self):
+        return self._diameter / 2
+
+    @radius.setter
+    def radius(self, radius):
+        self.diameter = 2 * radius
+
+    @classmethod
+    def from_perimeter(cls, perimeter):
+        return cls(perimeter / 2 / math.pi)  # cls is the type which shall be created
+
+    @cached_method
+    def perimeter(self):
+        return math.pi * self.radius * 2
+
+    __perimeter = perimeter
+
+    @cached_method
+    def area(self):
+        p = self.__perimeter()
+        r = p / 2 / math.pi
+        return math.pi * r ** 2
+
+    @staticmethod
+    def grad_to_rad(grad):
+        return grad / (2 * math.pi) 
+
+
+class HotCircle(Circle):
+    __slots__ = []
+    def perimeter(self):
+        return Circle.perimeter(self) * 1.25
+
+
+c = HotCircle(1)
+print(c.area(), c.perimeter())
+c.radius = 2
+print(c.area(), c.perimeter())
+
+# HotCircle overrides perimeter with a plain method and wins as usual, while
+# area keeps using the cached Circle.__perimeter. A subclass, which caches its
+# own methods, only has to declare the new slots in __slots__.
+c.diameter = 6
+print(c.area(), c.perimeter())
+
+
 # Now, you know how to use classes and how they support you in a lean workflow
 
 # One last point. Attribute access
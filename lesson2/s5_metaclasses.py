@@ -61,10 +61,108 @@ class B(A):
     foo = 42
     pass
 
-class C(A):
-    pass
+try:  # the file goes on after the error, see Registry below
+    class C(A):
+        pass
+except TypeError as ex:
+    print(ex)
 
 # Whenever a new class which inherits from A is defined, __init_subclass__ will
 # be called. It gives you the ability to hook into the class creation process
 # and enforce constraints on the deriving class
 
+
+# __init_subclass__ can do more than checking. It can remember every subclass
+# in a dict. This is a common pattern for plugins: every plugin is a subclass
+# of a base class and registers itself under a key, as soon as its module is
+# imported. Finding a plugin by its key is then a dict lookup instead of
+# walking through cls.__subclasses__() and their subclasses.
+# Class keyword arguments (class Hello(Plugin, key="hello")) are passed to
+# __init_subclass__, too.
+# At the same time, every plugin gets a dispatch dict, which maps its public
+# method names to the functions, so they can be called by name without
+# getattr searching through the class hierarchy on every call. Only plain
+# functions go into it, no staticmethods, classmethods or nested classes,
+# because call passes the instance as first argument.
+# Plugins, which live in their own modules, can be registered lazily with
+# just the name of their module. The module is imported on the first lookup,
+# so the program doesn't have to import all plugins at startup.
+import importlib
+from inspect import isfunction
+
+
+class Registry:
+    """base class for families of plugins, which register themselves"""
+    def __init_subclass__(cls, /, key=None, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if Registry in cls.__bases__:  # a new family, e.g. class Plugin(Registry)
+            if key is not None:
+                raise TypeError(f"{cls.__name__} starts a new family and "
+                                f"can't be registered under {key!r}")
+            cls._registry = {}
+            cls._lazy = {}
+            return
+        key = key or cls.__name__.lower()
+        if key in cls._registry:
+            raise TypeError(f"{key!r} is already registered by "
+                            f"{cls._registry[key].__name__}")
+        cls._registry[key] = cls
+        cls._lazy.pop(key, None)
+        cls.key = key
+        cls.dispatch = {}
+        for klass in reversed(cls.__mro__):
+            if klass in (Registry, object):
+                continue
+            for name, attr in vars(klass).items():
+                if name.startswith("_"):
+                    continue
+                if isfunction(attr):
+                    cls.dispatch[name] = attr
+                else:  # e.g. a staticmethod hides the inherited method
+                    cls.dispatch.pop(name, None)
+
+    @classmethod
+    def register_lazy(cls, key, module):
+        cls._lazy[key] = module
+
+    @classmethod
+    def lookup(cls, key):
+        try:
+            return cls._registry[key]
+        except KeyError:
+            pass
+        module = cls._lazy.get(key)
+        if module is None:
+            raise KeyError(f"no {cls.__name__} registered for {key!r}")
+        importlib.import_module(module)  # the module registers the class
+        return cls._registry[key]
+
+    def call(self, method, *args, **kwargs):
+        return self.dispatch[method](self, *args, **kwargs)
+
+
+class Plugin(Registry):
+    def run(self):
+        raise NotImplementedError
+
+
+class Hello(Plugin, key="hello"):
+    def run(self):
+        return "hello"
+
+
+class Shout(Hello):  # registered as "shout"
+    def run(self):
+        return super().run().upper()
+
+    def whisper(self):
+        return "psst"
+
+
+plugin = Plugin.lookup("shout")()
+print(plugin.call("run"), plugin.call("whisper"), sorted(Shout.dispatch))
+
+# A plugin in its own module (e.g. my_plugins/csv_plugin.py with
+# class CsvPlugin(Plugin, key="csv")) is registered like this:
+# Plugin.register_lazy("csv", "my_plugins.csv_plugin")
+# and my_plugins.csv_plugin is only imported by Plugin.lookup("csv")